@@ -3,7 +3,13 @@
 This module provides utilities for creating holes in layouts using tiling processors.
 """
 
-from typing import List, Tuple, Optional
+import functools
+import math
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import numpy.typing as npt
 
 import kfactory as kf
 from kfactory import kdb
@@ -11,6 +17,9 @@ from kfactory.layout import KCLayout
 from kfactory.kcell import KCell
 from kfactory.conf import config, logger
 
+TILES_PER_THREAD = 4
+DIRECT_MAX_HOLES = 100 * 100
+
 
 class HoleProcessor(kdb.TileOutputReceiver):
     """Output Receiver of the TilingProcessor for hole creation.
@@ -28,7 +37,8 @@ class HoleProcessor(kdb.TileOutputReceiver):
         hc_bbox: kdb.Box,
         row_step: kdb.Vector,
         column_step: kdb.Vector,
-        hole_margin: Optional[kdb.Vector] = None,
+        hole_margin: kdb.Vector | None = None,
+        origin: kdb.Point | None = None,
     ) -> None:
         """Initialize the hole processor.
         
@@ -40,6 +50,8 @@ class HoleProcessor(kdb.TileOutputReceiver):
             row_step: Step size for rows
             column_step: Step size for columns
             hole_margin: Optional margin around holes
+            origin: Optional origin of the hole raster, defaults to the origin
+                of each tile
         """
         if hole_margin is None:
             hole_margin = kdb.Vector(0, 0)
@@ -51,22 +63,59 @@ class HoleProcessor(kdb.TileOutputReceiver):
         self.row_step = row_step
         self.column_step = column_step
         self.hole_margin = hole_margin
-        self.holed_cells: List[kdb.Cell] = []
+        self.origin = origin
         
-        # create a temporary layout to work with
-        # this helps avoid modifying the original layout during processing
-        self.temp_ly = kdb.Layout()
-        self.temp_tc = self.temp_ly.create_cell(top_cell.name)
-        
-        # copy the hole cell to our temporary layout
-        # we need this to create the hole pattern
+        # find the first layer in the hole cell that has shapes
+        # this will be our target layer for creating holes
         hc = kcl.layout.cell(hole_cell_index)
-        self.temp_hc = self.temp_ly.create_cell(hc.name)
-        self.temp_hc_ind = self.temp_hc.cell_index()
-        self.temp_hc.copy_shapes(hc)
-        
-        # start making changes to the layout
-        self.temp_ly.start_changes()
+        self.target_layer: int | None = next(
+            (
+                layer
+                for layer in hc.layout().layer_indices()
+                if hc.shapes(layer).size() > 0
+            ),
+            None,
+        )
+        if self.target_layer is None:
+            logger.warning("no shapes found in hole cell {}", hc.name)
+            self.hole_polygons: list[kdb.Polygon] = []
+        else:
+            # the shapes of a single hole, these are copied to every position
+            # of the raster which fits into the region
+            self.hole_polygons = list(
+                kdb.Region(hc.begin_shapes_rec(self.target_layer)).each()
+            )
+        # if the hole consists of boxes only, the boxes are stored as arrays of
+        # their offsets to the hole origin and their sizes and grouped by size:
+        # the boxes of one size are created once for all positions of a tile
+        # and only moved (in C++) for the other offsets
+        self.hole_boxes: list[tuple[int, int, npt.NDArray[np.int64]]] | None = None
+        if self.hole_polygons and all(
+            polygon.is_box() for polygon in self.hole_polygons
+        ):
+            boxes = [polygon.bbox() for polygon in self.hole_polygons]
+            box_x = np.asarray(
+                [box.left - hc_bbox.left for box in boxes], dtype=np.int64
+            )
+            box_y = np.asarray(
+                [box.bottom - hc_bbox.bottom for box in boxes], dtype=np.int64
+            )
+            box_w = np.asarray([box.width() for box in boxes], dtype=np.int64)
+            box_h = np.asarray([box.height() for box in boxes], dtype=np.int64)
+            sizes, group = np.unique(
+                np.stack([box_w, box_h], axis=1), axis=0, return_inverse=True
+            )
+            group = group.ravel()
+            self.hole_boxes = [
+                (w, h, np.stack([box_x[group == i], box_y[group == i]], axis=1))
+                for i, (w, h) in enumerate(sizes.tolist())
+            ]
+        self.hole_is_bbox = self.hole_polygons == [kdb.Polygon(hc_bbox)]
+
+        # all holes of all tiles, the tiles deliver disjoint holes, so there
+        # is no need to merge them before the boolean
+        self.hole_region = kdb.Region()
+        self.hole_region.merged_semantics = False
 
     def put(
         self,
@@ -90,78 +139,188 @@ class HoleProcessor(kdb.TileOutputReceiver):
             dbu: Database units
             clip: Whether to clip the result
         """
-        # fill the region with holes using the hole cell
-        # this creates the actual hole pattern in our temporary layout
-        self.temp_tc.fill_region(
-            region=region,
-            fill_cell_index=self.temp_hc_ind,
-            fc_bbox=self.hc_bbox,
-            row_step=self.row_step,
-            column_step=self.column_step,
-            origin=tile.p1,
-            remaining_parts=None,
-            fill_margin=self.hole_margin,
-            remaining_polygons=None,
-            glue_box=tile,
+        if self.target_layer is None or region.is_empty():
+            return
+
+        xs, ys = self._fitting(region, tile.p1 if self.origin is None else self.origin)
+        if xs.size == 0:
+            return
+        positions = list(zip(xs.tolist(), ys.tolist(), strict=True))
+        if self.hole_boxes is not None:
+            # no need to copy shapes, create the boxes of each size for all
+            # positions and move them to the offsets of the boxes
+            for w, h, offsets in self.hole_boxes:
+                boxes = kdb.Region([kdb.Box(x, y, x + w, y + h) for x, y in positions])
+                for dx, dy in offsets.tolist():
+                    self.hole_region += boxes.moved(dx, dy) if dx or dy else boxes
+        else:
+            # copy the hole shapes to every position that fits
+            p1 = self.hc_bbox.p1
+            self.hole_region.insert(
+                [
+                    polygon.moved(x - p1.x, y - p1.y)
+                    for x, y in positions
+                    for polygon in self.hole_polygons
+                ]
+            )
+
+    def _fitting(
+        self, region: kdb.Region, origin: kdb.Point
+    ) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+        """Raster positions where the hole (plus margin) fits into `region`.
+
+        Returns:
+            x and y coordinates of the lower left corners of the holes.
+        """
+        w, h = self.hc_bbox.width(), self.hc_bbox.height()
+        mx, my = self.hole_margin.x, self.hole_margin.y
+        row, col = self.row_step, self.column_step
+        xs, ys = self._raster(region.bbox().enlarged(-mx, -my), origin)
+        if xs.size == 0:
+            return xs, ys
+
+        if (
+            row.y == 0
+            and col.x == 0
+            and 0 < w + 2 * mx <= row.x
+            and 0 < h + 2 * my <= col.y
+        ):
+            # a rectangular raster, rasterize the region with one pixel per
+            # hole. a hole fits where its pixel is completely covered
+            x0, y0 = int(xs.min()), int(ys.min())
+            nx = (int(xs.max()) - x0) // row.x + 1
+            ny = (int(ys.max()) - y0) // col.y + 1
+            coverage = np.array(
+                region.rasterize(
+                    kdb.Point(x0 - mx, y0 - my),
+                    kdb.Vector(row.x, col.y),
+                    kdb.Vector(w + 2 * mx, h + 2 * my),
+                    nx,
+                    ny,
+                )
+            )
+            iy, ix = np.nonzero(coverage >= (w + 2 * mx) * (h + 2 * my) - 0.5)
+            return x0 + ix * row.x, y0 + iy * col.y
+
+        # any other raster, check all hole boxes at once
+        candidates = kdb.Region(
+            [
+                kdb.Box(x - mx, y - my, x + w + mx, y + h + my)
+                for x, y in zip(xs.tolist(), ys.tolist(), strict=True)
+            ]
+        )
+        candidates.merged_semantics = False
+        p1s = [box.p1 for box in (p.bbox() for p in candidates.inside(region).each())]
+        return (
+            np.array([p.x + mx for p in p1s], dtype=np.int64),
+            np.array([p.y + my for p in p1s], dtype=np.int64),
         )
 
+    def _raster(
+        self, box: kdb.Box, origin: kdb.Point
+    ) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+        """Raster positions where the hole bounding box is inside `box`.
+
+        Returns:
+            x and y coordinates of the lower left corners of the holes.
+        """
+        row, col = self.row_step, self.column_step
+        det = row.x * col.y - row.y * col.x
+        # raster coordinates of the corners of the box
+        cx = np.array([box.left, box.right, box.left, box.right]) - origin.x
+        cy = np.array([box.bottom, box.bottom, box.top, box.top]) - origin.y
+        i_s = (cx * col.y - cy * col.x) / det
+        j_s = (row.x * cy - row.y * cx) / det
+        i, j = np.meshgrid(
+            np.arange(math.floor(i_s.min()), math.ceil(i_s.max()) + 1),
+            np.arange(math.floor(j_s.min()), math.ceil(j_s.max()) + 1),
+            indexing="ij",
+        )
+        xs = (origin.x + i * row.x + j * col.x).ravel()
+        ys = (origin.y + i * row.y + j * col.y).ravel()
+        inside = (
+            (xs >= box.left)
+            & (ys >= box.bottom)
+            & (xs + self.hc_bbox.width() <= box.right)
+            & (ys + self.hc_bbox.height() <= box.top)
+        )
+        return xs[inside], ys[inside]
+
     def insert_holes(self) -> None:
         """Insert holes into the processed regions.
         
         This method finalizes the hole creation process by:
-        1. Ending the layout changes
-        2. Getting the target layer from the hole cell
-        3. Creating the hole pattern
-        4. Subtracting holes from the original region
-        5. Inserting the final result
+        1. Subtracting the collected holes from the original region
+        2. Inserting the final result
+
+        Only the last step modifies the layout of the top cell.
         """
-        # finish making changes to the temporary layout
-        self.temp_ly.end_changes()
-        
-        # find the first layer in the hole cell that has shapes
-        # this will be our target layer for creating holes
-        hole_cell = self.kcl.layout.cell(self.hole_cell_index)
-        target_layer = None
-        for layer in hole_cell.layout().layer_indices():
-            if hole_cell.shapes(layer).size() > 0:
-                target_layer = layer
-                break
-        
         # if no shapes found, we can't create holes
+        target_layer = self.target_layer
         if target_layer is None:
-            logger.warning("no shapes found in hole cell")
             return
-            
-        # get all the holes we created in the temporary layout
+
+        # all the holes collected from the tiles
         # this is our hole pattern that we'll subtract from the original
-        hole_pattern = kdb.Region(self.temp_tc.begin_shapes_rec(target_layer))
-        
-        # get the original shapes from the target layer
-        # these are the shapes we'll be making holes in
-        original_region = kdb.Region(self.top_cell.begin_shapes_rec(target_layer))
-        
-        # subtract the holes from the original shapes
-        # this creates the final result with holes
-        final_region = original_region - hole_pattern
-        
+        hole_pattern = self.hole_region
+
+        # nothing to subtract, leave the target layer untouched
+        # (the original region would still reference the shapes we clear)
+        if hole_pattern.is_empty():
+            return
+
+        # get the original shapes from the target layer of the top cell
+        # these are the shapes we'll be making holes in. child cells aren't
+        # modified, so their shapes are neither flattened nor copied into the
+        # top cell
+        original_region = kdb.Region(self.top_cell.shapes(target_layer))
+        original_region.enable_progress(f"hole subtract {self.top_cell.name}")
+
+        # subtract the holes from the original shapes in place
+        # this avoids a temporary copy of the final result
+        original_region -= hole_pattern
+
+        # the holes aren't needed anymore, free them before the result is
+        # inserted to keep the peak memory down
+        del hole_pattern
+        self.hole_region.clear()
+
+        # if the holes don't touch the original shapes, the result can still
+        # be a view on the target layer, clearing the layer would empty it.
+        # copy the result out of the layout first
+        result = kdb.Shapes()
+        result.insert(original_region)
+        del original_region
+
         # clear the target layer and insert our final result
-        # this updates the original layout with the holes
-        self.top_cell.shapes(target_layer).clear()
-        self.top_cell.shapes(target_layer).insert(final_region)
+        # this updates the original layout with the holes. only this step
+        # modifies the layout, so only this step runs in changes mode
+        self.kcl.start_changes()
+        try:
+            shapes = self.top_cell.shapes(target_layer)
+            shapes.clear()
+            shapes.insert(result)
+        finally:
+            self.kcl.end_changes()
 
 
 def hole_tiled(
     c: kf.KCell,
     hole_cell: kf.KCell,
-    hole_layers: list[tuple[kdb.LayerInfo, int]] = [],
-    hole_regions: list[tuple[kdb.Region, int]] = [],
-    exclude_layers: list[tuple[kdb.LayerInfo, int]] = [],
-    exclude_regions: list[tuple[kdb.Region, int]] = [],
+    hole_layers: list[tuple[kdb.LayerInfo, int]] | None = None,
+    hole_regions: list[tuple[kdb.Region, int]] | None = None,
+    exclude_layers: list[tuple[kdb.LayerInfo, int]] | None = None,
+    exclude_regions: list[tuple[kdb.Region, int]] | None = None,
     x_space: float = 0,
     y_space: float = 0,
+    bands: int = 1,
 ) -> None:
     """Tile holes in the specified regions/layers of a KCell.
-    
+
+    Holes are only cut into the target layer of `c` itself. Child cells are
+    not modified (they might be shared with other cells or locked), so shapes
+    of the target layer inside child cells don't get any holes.
+
     Args:
         c: Target cell.
         hole_cell: The cell used as a hole (subtracted from the region).
@@ -171,160 +330,291 @@ def hole_tiled(
         exclude_regions: Specific regions to ignore. Tuples like the hole layers.
         x_space: Spacing between the hole cell bounding boxes in x-direction.
         y_space: Spacing between the hole cell bounding boxes in y-direction.
+        bands: Split the area into `bands x bands` parts. Each part gets its own
+            tiling processor and the parts are processed in a thread pool. The
+            threads (`config.n_threads`) are split between the parts, this
+            doesn't necessarily make the hole creation any faster.
+
+    Raises:
+        ValueError: If `bands` is smaller than 1.
     """
-    # create a tiling processor to handle the hole creation
-    # this will help us efficiently process large layouts
-    tp = kdb.TilingProcessor()
-    
+    if bands < 1:
+        raise ValueError(f"bands must be at least 1, got {bands}.")
+    hole_layers = hole_layers or []
+    hole_regions = hole_regions or []
+    exclude_layers = exclude_layers or []
+    exclude_regions = exclude_regions or []
+
+    # look up the hole cell dimensions and the dbu once
+    # every call on them goes through the KLayout bindings
+    hc_bbox = hole_cell.bbox()
+    if hc_bbox.empty():
+        logger.warning("no shapes found in hole cell {}", hole_cell.name)
+        return
+    hc_w, hc_h = hc_bbox.width(), hc_bbox.height()
+    hc_dbbox = hole_cell.dbbox()
+    hc_dw, hc_dh = hc_dbbox.width(), hc_dbbox.height()
+    dbu = c.kcl.dbu
+    to_dbu = c.kcl.to_dbu
+
     # calculate the total area we need to process
     # this includes any specific regions we want to hole
     dbb = c.dbbox()
     for r, ext in hole_regions:
-        dbb += r.bbox().to_dtype(c.kcl.dbu).enlarged(ext)
-    tp.frame = dbb  # type: ignore[assignment, misc]
-    tp.dbu = c.kcl.dbu
-    tp.threads = config.n_threads
-
-    # figure out how big each tile should be
-    # we want tiles big enough to fit our hole pattern plus spacing
-    tile_size = (
-        100 * (hole_cell.dbbox().width() + x_space),
-        100 * (hole_cell.dbbox().height() + y_space),
-    )
-    tp.tile_size(*tile_size)
-    tp.tile_border(20, 20)  # add some border to make sure holes line up right
-
-    # set up all the layers we want to process
-    # these are the layers we'll be making holes in
-    layer_names: list[str] = []
-    for _layer, _ in hole_layers:
-        layer_name = (
-            f"layer{_layer.name}"
-            if _layer.is_named()
-            else f"layer_{_layer.layer}_{_layer.datatype}"
-        )
-        tp.input(layer_name, c.kcl.layout, c.cell_index(), _layer)
-        layer_names.append(layer_name)
-
-    # set up any specific regions we want to process
-    # these are areas where we definitely want holes
-    region_names: list[str] = []
-    for i, (r, _) in enumerate(hole_regions):
-        region_name = f"region{i}"
-        tp.input(region_name, r)
-        region_names.append(region_name)
-
-    # set up layers we want to exclude
-    # these are areas where we don't want any holes
-    exlayer_names: list[str] = []
-    for _layer, _ in exclude_layers:
-        layer_name = (
-            f"layer{_layer.name}"
-            if _layer.is_named()
-            else f"layer_{_layer.layer}_{_layer.datatype}"
-        )
-        tp.input(layer_name, c.kcl.layout, c.cell_index(), _layer)
-        exlayer_names.append(layer_name)
+        dbb += r.bbox().to_dtype(dbu).enlarged(ext)
 
-    # set up regions we want to exclude
-    # these are specific areas where we don't want holes
-    exregion_names: list[str] = []
-    for i, (r, _) in enumerate(exclude_regions):
-        region_name = f"region{i}"
-        tp.input(region_name, r)
-        exregion_names.append(region_name)
+    # skip the tiling altogether if there is nothing to put holes into
+    # layers are checked recursively, their shapes might be in child cells
+    hole_layer_indexes = [c.kcl.layout.find_layer(_layer) for _layer, _ in hole_layers]
+    if dbb.empty() or not (
+        any(not r.is_empty() for r, _ in hole_regions)
+        or any(
+            not c.begin_shapes_rec(li).at_end()
+            for li in hole_layer_indexes
+            if li is not None
+        )
+    ):
+        logger.debug("no regions to create holes in for {}", c.name)
+        return
 
     # calculate how far to step between holes
     # this determines the spacing between holes in the pattern
-    row_step = kdb.Vector(hole_cell.bbox().width() + int(x_space / c.kcl.dbu), 0)
-    col_step = kdb.Vector(0, hole_cell.bbox().height() + int(y_space / c.kcl.dbu))
-    hc_bbox = hole_cell.bbox()
+    # all tiles (and bands) place their holes on the same raster
+    row_step = kdb.Vector(hc_w + int(x_space / dbu), 0)
+    col_step = kdb.Vector(0, hc_h + int(y_space / dbu))
+    origin = to_dbu(dbb.p1)
 
-    # create our hole processor
-    # this will handle the actual hole creation for each tile
-    operator = HoleProcessor(
-        c.kcl,
-        c,
-        hole_cell.cell_index(),
-        hc_bbox=hc_bbox,
-        row_step=row_step,
-        column_step=col_step,
-    )
-    tp.output("to_hole", operator)
-
-    # build the processing string for the tiling processor
-    # this tells it how to create the holes and what to exclude
-    if layer_names or region_names:
-        # combine all the exclude layers and regions
-        # we'll use these to avoid making holes in certain areas
-        exlayers = " + ".join(
-            [
-                layer_name + f".sized({c.kcl.to_dbu(size)})" if size else layer_name
-                for layer_name, (_, size) in zip(
-                    exlayer_names, exclude_layers, strict=False
-                )
-            ]
+    def _new_operator() -> HoleProcessor:
+        # create our hole processor
+        # this will handle the actual hole creation for each tile
+        return HoleProcessor(
+            c.kcl,
+            c,
+            hole_cell.cell_index(),
+            hc_bbox=hc_bbox,
+            row_step=row_step,
+            column_step=col_step,
+            origin=origin,
         )
-        exregions = " + ".join(
-            [
-                region_name + f".sized({c.kcl.to_dbu(size)})" if size else region_name
-                for region_name, (_, size) in zip(
-                    exregion_names, exclude_regions, strict=False
-                )
-            ]
-        )
-        
-        # combine all the layers and regions we want to hole
-        # these are the areas where we'll create holes
-        layers = " + ".join(
-            [
-                layer_name + f".sized({c.kcl.to_dbu(size)})" if size else layer_name
-                for layer_name, (_, size) in zip(layer_names, hole_layers, strict=False)
-            ]
-        )
-        regions = " + ".join(
-            [
-                region_name + f".sized({c.kcl.to_dbu(size)})" if size else region_name
-                for region_name, (_, size) in zip(
-                    region_names, hole_regions, strict=False
-                )
-            ]
+
+    # without a hole shape there is nothing to cut
+    operator = _new_operator()
+    if operator.target_layer is None:
+        return
+
+    # split the area into overlapping bands
+    # holes crossing a band border are found by both neighbors, they end up
+    # at the same position so they can simply be added up
+    band_w = dbb.width() / bands
+    band_h = dbb.height() / bands
+    frames = [
+        kdb.DBox(
+            dbb.left + ix * band_w,
+            dbb.bottom + iy * band_h,
+            dbb.left + (ix + 1) * band_w,
+            dbb.bottom + (iy + 1) * band_h,
+        ).enlarged(hc_dw, hc_dh)
+        & dbb
+        for ix in range(bands)
+        for iy in range(bands)
+    ]
+    n_threads = max(config.n_threads // len(frames), 1)
+
+    # collect the inputs of the tiling processors
+    # layers are named by their layer index, layer names could contain
+    # characters the expression parser doesn't accept and named layers don't
+    # need a layer/datatype. a layer used on both the hole and the exclude side
+    # is only registered (and tiled) once. layers which don't exist in the
+    # layout don't contribute anything and are skipped.
+    # sized layers and regions are sized once here instead of in every tile
+    inputs: dict[str, int | kdb.Region] = {}
+
+    def _register(
+        layers: list[tuple[kdb.LayerInfo, int]],
+        regions: list[tuple[kdb.Region, int]],
+        region_prefix: str,
+    ) -> list[str]:
+        names: list[str] = []
+        for _layer, size in layers:
+            li = c.kcl.layout.find_layer(_layer)
+            if li is None:
+                continue
+            layer_name = f"layer{li}"
+            if not size:
+                inputs[layer_name] = li
+            else:
+                d = to_dbu(size)
+                layer_name += f"_sized_{d}" if d > 0 else f"_sized_m{-d}"
+                if layer_name not in inputs:
+                    inputs[layer_name] = kdb.Region(c.begin_shapes_rec(li)).sized(d)
+            names.append(layer_name)
+        for i, (r, size) in enumerate(regions):
+            region_name = f"{region_prefix}{i}"
+            inputs[region_name] = r.sized(to_dbu(size)) if size else r
+            names.append(region_name)
+        return names
+
+    # these are the areas where we'll create holes
+    hole_names = _register(hole_layers, hole_regions, "region")
+    # these are areas where we don't want any holes
+    exclude_names = _register(exclude_layers, exclude_regions, "exregion")
+    queue_str = _queue_str(tuple(hole_names), tuple(exclude_names), hc_w, hc_h)
+    logger.debug("hole string: '{}'", queue_str)
+
+    def _tile_holes(frame: kdb.DBox, operator: HoleProcessor) -> None:
+        # create a tiling processor to handle the hole creation
+        # this will help us efficiently process large layouts
+        tp = kdb.TilingProcessor()
+        tp.frame = frame  # type: ignore[assignment, misc]
+        tp.dbu = dbu
+        tp.threads = n_threads
+
+        # figure out how big each tile should be
+        # aim for a few tiles per thread so all threads have work, but keep
+        # between 4 and 100 holes per tile side
+        pitch_x = hc_dw + x_space
+        pitch_y = hc_dh + y_space
+        n_holes = frame.width() * frame.height() / (pitch_x * pitch_y)
+        holes_per_side = min(
+            max(math.ceil(math.sqrt(n_holes / (n_threads * TILES_PER_THREAD))), 4),
+            100,
         )
+        tp.tile_size(holes_per_side * pitch_x, holes_per_side * pitch_y)
+        # the inputs are sized already, the border only has to fit a hole
+        tp.tile_border(hc_dw, hc_dh)
 
-        # build the final processing string
-        # this tells the tiling processor exactly what to do
-        if exlayer_names or exregion_names:
-            queue_str = (
-                "var hole= "
-                + (f"{layers} + {regions}" if regions and layers else regions + layers)
-                + "; var exclude = "
-                + (
-                    f"{exlayers} + {exregions}"
-                    if exregions and exlayers
-                    else exregions + exlayers
-                )
-                + "; var hole_region = _tile.minkowski_sum(Box.new("
-                f"0,0,{hc_bbox.width() - 1},{hc_bbox.height() - 1}))"
-                " & _frame & hole - exclude; _output(to_hole, hole_region)"
-            )
-        else:
-            queue_str = (
-                "var hole= "
-                + (f"{layers} + {regions}" if regions and layers else regions + layers)
-                + "; var hole_region = _tile.minkowski_sum(Box.new("
-                f"0,0,{hc_bbox.width() - 1},{hc_bbox.height() - 1}))"
-                " & _frame & hole;"
-                " _output(to_hole, hole_region)"
-            )
+        for name, source in inputs.items():
+            if isinstance(source, kdb.Region):
+                tp.input(name, source)
+            else:
+                tp.input(name, c.kcl.layout, c.cell_index(), source)
+
+        tp.output("to_hole", operator)
         tp.queue(queue_str)
-        c.kcl.start_changes()
-        try:
-            logger.debug(
-                "creating holes in {} with {}", c.kcl.future_cell_name or c.name, hole_cell.name
+        # the tiling only reads from the layout, the holes are collected in
+        # the hole region of the operator
+        tp.execute(f"hole {c.name}")
+
+    logger.debug(
+        "creating holes in {} with {}", c.kcl.future_cell_name or c.name, hole_cell.name
+    )
+    n_holes = dbb.width() * dbb.height() / ((hc_dw + x_space) * (hc_dh + y_space))
+    if (
+        operator.hole_is_bbox
+        and bands == 1
+        and (n_holes <= DIRECT_MAX_HOLES or config.n_threads == 1)
+    ):
+        # small layouts (or no threads to spread the tiles over) don't gain
+        # anything from the tiling processor if the hole is a single rectangle
+        # build the hole region with plain booleans and place the holes
+        # block by block instead
+
+        def _region(name: str) -> kdb.Region:
+            source = inputs[name]
+            if isinstance(source, kdb.Region):
+                return source
+            return kdb.Region(c.begin_shapes_rec(source))
+
+        region = kdb.Region(to_dbu(dbb))
+        region &= _sum_regions(_region(name) for name in hole_names)
+        if exclude_names:
+            region -= _sum_regions(_region(name) for name in exclude_names)
+        inputs.clear()
+        _put_region(operator, region)
+        logger.info("done with calculating hole regions for {}", c.name)
+        operator.insert_holes()
+        return
+
+    # every band collects its holes in its own operator
+    operators = [operator] + [_new_operator() for _ in frames[1:]]
+    if len(frames) == 1:
+        _tile_holes(frames[0], operator)
+    else:
+        # make sure the layout is up to date before the bands start
+        # reading from it concurrently
+        c.kcl.layout.update()
+        with ThreadPoolExecutor(
+            max_workers=min(len(frames), config.n_threads)
+        ) as executor:
+            list(executor.map(_tile_holes, frames, operators))
+    logger.info("done with calculating hole regions for {}", c.name)
+
+    # the sized inputs aren't needed anymore
+    inputs.clear()
+
+    # collect the holes of all bands and subtract them at once
+    # each band is dropped as soon as its holes are added
+    operator = operators.pop(0)
+    while operators:
+        operator.hole_region += operators.pop().hole_region
+    operator.insert_holes()
+
+
+def _sum_regions(regions: Iterable[kdb.Region]) -> kdb.Region:
+    """Combine regions into one (without merging)."""
+    result = kdb.Region()
+    for region in regions:
+        result += region
+    return result
+
+
+def _put_region(
+    operator: HoleProcessor, region: kdb.Region, block_size: int = 256
+) -> None:
+    """Hand a region directly to a hole processor.
+
+    The region is split into blocks of at most `block_size` x `block_size` holes
+    aligned to the hole raster. As with the tiles of the tiling processor, a
+    block is extended by the hole size to the top right, so every hole belongs
+    to exactly one block.
+    """
+    bbox = region.bbox()
+    if bbox.empty():
+        return
+    w, h = operator.hc_bbox.width(), operator.hc_bbox.height()
+    block_w = operator.row_step.x * block_size
+    block_h = operator.column_step.y * block_size
+    origin = operator.origin or kdb.Point(0, 0)
+    dbu = operator.kcl.dbu
+    if bbox.width() <= block_w and bbox.height() <= block_h:
+        operator.put(0, 0, bbox, region, dbu, False)
+        return
+    x0 = origin.x + (bbox.left - origin.x) // block_w * block_w
+    y0 = origin.y + (bbox.bottom - origin.y) // block_h * block_h
+    for ix, x in enumerate(range(x0, bbox.right, block_w)):
+        for iy, y in enumerate(range(y0, bbox.top, block_h)):
+            block = kdb.Box(x, y, x + block_w, y + block_h)
+            operator.put(
+                ix,
+                iy,
+                block,
+                region & kdb.Box(block.p1, block.p2 + kdb.Vector(w - 1, h - 1)),
+                dbu,
+                False,
             )
-            logger.debug("hole string: '{}'", queue_str)
-            tp.execute(f"hole {c.name}")
-            logger.info("done with calculating hole regions for {}", c.name)
-            operator.insert_holes()
-        finally:
-            c.kcl.end_changes() 
\ No newline at end of file
+
+
+@functools.lru_cache(maxsize=64)
+def _queue_str(
+    hole_names: tuple[str, ...], exclude_names: tuple[str, ...], hc_w: int, hc_h: int
+) -> str:
+    """Build the processing string of the tiling processor.
+
+    The input names only depend on the layers and the number of regions, so
+    repeated calls (e.g. parameter sweeps) reuse the same string.
+
+    The tile is extended by the hole size to the top right, so holes starting
+    in this tile fit completely. This is the minkowski sum of the tile with the
+    hole box, but a plain box is much cheaper.
+    """
+    hole_expr = " + ".join(hole_names)
+    exclude_expr = " + ".join(exclude_names)
+    return (
+        f"var hole = {hole_expr}; "
+        + (f"var exclude = {exclude_expr}; " if exclude_expr else "")
+        + "var tb = _tile.bbox(); var tile = Region.new(Box.new(tb.left, "
+        f"tb.bottom, tb.right + {hc_w - 1}, tb.top + {hc_h - 1})); "
+        "var hole_region = tile & _frame & hole"
+        + (" - exclude" if exclude_expr else "")
+        + "; _output(to_hole, hole_region)"
+    )
@@ -0,0 +1,207 @@
+import pytest
+
+import kfactory as kf
+from kfactory.utils import hole
+from tests.conftest import Layers
+
+
+@pytest.fixture(params=["direct", "tiled"])
+def hole_path(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> str:
+    """Create the holes without or with the tiling processor."""
+    if request.param == "direct":
+        monkeypatch.setattr(kf.config, "n_threads", 1)
+    else:
+        monkeypatch.setattr(hole, "DIRECT_MAX_HOLES", -1)
+        monkeypatch.setattr(kf.config, "n_threads", 2)
+    return request.param
+
+
+def hole_cell(layers: Layers) -> kf.KCell:
+    hc = kf.KCell()
+    hc.shapes(hc.kcl.find_layer(layers.WG)).insert(kf.kdb.DBox(2, 2))
+    return hc
+
+
+@pytest.mark.usefixtures("hole_path")
+def test_tiled_hole(layers: Layers) -> None:
+    c = kf.KCell()
+    c.shapes(layers.WG).insert(kf.kdb.DBox(100, 60))
+    c.shapes(layers.WGEXCLUDE).insert(kf.kdb.DBox(10, 10))
+    kf.utils.hole_tiled(
+        c,
+        hole_cell(layers),
+        [(layers.WG, 0)],
+        exclude_layers=[(layers.WGEXCLUDE, 0)],
+        x_space=3,
+        y_space=3,
+    )
+
+    r = kf.kdb.Region(c.begin_shapes_rec(c.kcl.find_layer(layers.WG)))
+    # 20 x 12 holes of 2um x 2um, minus the 4 covered by the exclude box
+    assert r.area() == c.kcl.to_dbu(kf.kdb.DBox(100, 60)).area() - 236 * 2000**2
+
+
+@pytest.mark.usefixtures("hole_path")
+def test_tiled_hole_empty(layers: Layers) -> None:
+    c = kf.KCell()
+    c.shapes(layers.WG).insert(kf.kdb.DBox(100, 60))
+    c.shapes(layers.WGEXCLUDE).insert(kf.kdb.DBox(200, 200))
+    kf.utils.hole_tiled(
+        c,
+        hole_cell(layers),
+        [(layers.WG, 0)],
+        exclude_layers=[(layers.WGEXCLUDE, 0)],
+    )
+
+    r = kf.kdb.Region(c.begin_shapes_rec(c.kcl.find_layer(layers.WG)))
+    assert r.area() == c.kcl.to_dbu(kf.kdb.DBox(100, 60)).area()
+
+
+@pytest.mark.usefixtures("hole_path")
+@pytest.mark.parametrize(
+    ("hole_size", "exclude_size", "n_holes"),
+    [
+        # the hole layer is clipped to the cell, growing it doesn't add holes
+        (5, 0, 236),
+        # 18 x 10 holes fit into the shrunk hole layer, 4 are excluded
+        (-5, 0, 176),
+        # the exclude box grows from 10um to 20um and covers 4 x 4 holes
+        (0, 5, 224),
+        # the exclude box shrinks to 4um and covers a single hole
+        (0, -3, 239),
+    ],
+)
+def test_tiled_hole_sized(
+    layers: Layers, hole_size: float, exclude_size: float, n_holes: int
+) -> None:
+    c = kf.KCell()
+    c.shapes(layers.WG).insert(kf.kdb.DBox(100, 60))
+    c.shapes(layers.WGEXCLUDE).insert(kf.kdb.DBox(10, 10))
+    kf.utils.hole_tiled(
+        c,
+        hole_cell(layers),
+        [(layers.WG, hole_size)],
+        exclude_layers=[(layers.WGEXCLUDE, exclude_size)],
+        x_space=3,
+        y_space=3,
+    )
+
+    r = kf.kdb.Region(c.begin_shapes_rec(c.kcl.find_layer(layers.WG)))
+    assert r.area() == c.kcl.to_dbu(kf.kdb.DBox(100, 60)).area() - n_holes * 2000**2
+
+
+@pytest.mark.usefixtures("hole_path")
+def test_tiled_hole_named_layers(layers: Layers) -> None:
+    exa = kf.kdb.LayerInfo("EXA")
+    exb = kf.kdb.LayerInfo("EXB")
+    c = kf.KCell()
+    c.shapes(layers.WG).insert(kf.kdb.DBox(100, 60))
+    c.shapes(c.kcl.layout.layer(exa)).insert(kf.kdb.DBox(10, 10))
+    c.shapes(c.kcl.layout.layer(exb)).insert(kf.kdb.DBox(20, 0, 30, 10))
+    kf.utils.hole_tiled(
+        c,
+        hole_cell(layers),
+        [(layers.WG, 0)],
+        exclude_layers=[(exa, 0), (exb, 0), (kf.kdb.LayerInfo("MISSING"), 0)],
+        x_space=3,
+        y_space=3,
+    )
+
+    r = kf.kdb.Region(c.begin_shapes_rec(c.kcl.find_layer(layers.WG)))
+    # 20 x 12 holes of 2um x 2um, minus 4 holes covered by each exclude box
+    assert r.area() == c.kcl.to_dbu(kf.kdb.DBox(100, 60)).area() - 232 * 2000**2
+
+
+@pytest.mark.usefixtures("hole_path")
+def test_tiled_hole_miss(layers: Layers) -> None:
+    c = kf.KCell()
+    c.shapes(layers.WG).insert(kf.kdb.DBox(0, 0, 50, 50))
+    c.shapes(layers.WGCLAD).insert(kf.kdb.DBox(100, 0, 150, 50))
+    kf.utils.hole_tiled(c, hole_cell(layers), [(layers.WGCLAD, 0)], x_space=3)
+
+    # the holes don't touch the shapes of the target layer, they stay as they are
+    r = kf.kdb.Region(c.begin_shapes_rec(c.kcl.find_layer(layers.WG)))
+    assert r.area() == c.kcl.to_dbu(kf.kdb.DBox(50, 50)).area()
+
+
+def test_tiled_hole_empty_cell(layers: Layers) -> None:
+    c = kf.KCell()
+    c.shapes(layers.WG).insert(kf.kdb.DBox(100, 60))
+    kf.utils.hole_tiled(c, kf.KCell(), [(layers.WG, 0)])
+
+    r = kf.kdb.Region(c.begin_shapes_rec(c.kcl.find_layer(layers.WG)))
+    assert r.area() == c.kcl.to_dbu(kf.kdb.DBox(100, 60)).area()
+
+
+@pytest.mark.usefixtures("hole_path")
+def test_tiled_hole_regions(layers: Layers) -> None:
+    c = kf.KCell()
+    c.shapes(layers.WG).insert(kf.kdb.DBox(200, 200))
+    exclude = kf.kdb.Region(kf.kdb.Box(0, 0, 20_000, 20_000))
+    kf.utils.hole_tiled(
+        c,
+        hole_cell(layers),
+        hole_regions=[(kf.kdb.Region(kf.kdb.Box(100_000)), 0)],
+        exclude_regions=[(exclude, 0)],
+        x_space=4,
+        y_space=4,
+    )
+
+    r = kf.kdb.Region(c.begin_shapes_rec(c.kcl.find_layer(layers.WG)))
+    assert r.area() < c.kcl.to_dbu(kf.kdb.DBox(200, 200)).area()
+    assert (exclude - r).is_empty()
+
+
+def test_tiled_hole_bands(layers: Layers) -> None:
+    regions: list[kf.kdb.Region] = []
+    for bands in (1, 3):
+        c = kf.KCell()
+        c.shapes(layers.WG).insert(kf.kdb.DPolygon.ellipse(kf.kdb.DBox(500, 300), 64))
+        kf.utils.hole_tiled(
+            c, hole_cell(layers), [(layers.WG, 0)], x_space=3, y_space=3, bands=bands
+        )
+        regions.append(kf.kdb.Region(c.begin_shapes_rec(c.kcl.find_layer(layers.WG))))
+
+    assert (regions[0] ^ regions[1]).is_empty()
+
+
+def test_tiled_hole_boxes(layers: Layers) -> None:
+    hc = kf.KCell()
+    wg = hc.kcl.find_layer(layers.WG)
+    hc.shapes(wg).insert(kf.kdb.DBox(0, 0, 1, 4))
+    hc.shapes(wg).insert(kf.kdb.DBox(2, 0, 3, 4))
+    hc.shapes(wg).insert(kf.kdb.DBox(0, 5, 3, 6))
+    c = kf.KCell()
+    c.shapes(layers.WG).insert(kf.kdb.DBox(0, 0, 100, 60))
+    kf.utils.hole_tiled(c, hc, [(layers.WG, 0)], x_space=1, y_space=4)
+
+    r = kf.kdb.Region(c.begin_shapes_rec(c.kcl.find_layer(layers.WG)))
+    # 25 x 6 holes, each one made of 11um2 of boxes
+    assert r.area() == c.kcl.to_dbu(kf.kdb.DBox(100, 60)).area() - 150 * 11 * 1000**2
+
+
+@pytest.mark.usefixtures("hole_path")
+def test_tiled_hole_hierarchy(layers: Layers) -> None:
+    child = kf.KCell()
+    child.shapes(layers.WG).insert(kf.kdb.DBox(40, 40))
+    c = kf.KCell()
+    c << child
+    c.shapes(layers.WG).insert(kf.kdb.DBox(50, -20, 90, 20))
+    kf.utils.hole_tiled(c, hole_cell(layers), [(layers.WG, 0)], x_space=2, y_space=2)
+
+    wg = c.kcl.find_layer(layers.WG)
+    # child cells aren't modified, only the box of the top cell gets its
+    # 10 x 10 holes
+    assert kf.kdb.Region(child.shapes(wg)).area() == 1600 * 1000**2
+    assert kf.kdb.Region(c.shapes(wg)).area() == (1600 - 10 * 10 * 4) * 1000**2
+    assert (
+        kf.kdb.Region(c.begin_shapes_rec(wg)).area()
+        == (1600 + 1600 - 10 * 10 * 4) * 1000**2
+    )
+
+
+def test_tiled_hole_bands_invalid(layers: Layers) -> None:
+    c = kf.KCell()
+    c.shapes(layers.WG).insert(kf.kdb.DBox(100, 60))
+    with pytest.raises(ValueError):
+        kf.utils.hole_tiled(c, hole_cell(layers), [(layers.WG, 0)], bands=0)